@@ -1,62 +1,120 @@
 import librosa
-import json
+import orjson
 import sys
 import os
 import numpy as np
+from numba import njit
 from typing import List, Dict, Tuple
 
-def analyze_audio_features(y: np.ndarray, sr: int) -> Tuple[np.ndarray, float]:
+# Optional GPU backend for the spectrogram
+try:
+    import torch
+    import torchaudio
+except ImportError:
+    torch = None
+    torchaudio = None
+
+HOP_LENGTH = 512
+N_FFT = 2048
+
+def cuda_available() -> bool:
+    """Return True if torch/torchaudio are installed and a CUDA device is present."""
+    return torch is not None and torch.cuda.is_available()
+
+def gpu_magnitude_spectrogram(y: np.ndarray, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """
+    Compute the magnitude STFT on the GPU, matching librosa.stft's defaults.
+    The FFT runs in half precision (n_fft must be a power of two for cuFFT)
+    and the result is returned to the host as float32.
+    """
+    y_t = torch.from_numpy(y).to('cuda', dtype=torch.float16)
+    spectrogram = torchaudio.transforms.Spectrogram(
+        n_fft=n_fft, hop_length=hop_length, power=1.0, pad_mode='constant'
+    ).to('cuda', torch.float16)
+    return spectrogram(y_t).float().cpu().numpy()
+
+def magnitude_spectrogram(y: np.ndarray, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """
+    Compute the magnitude spectrogram shared by beat tracking and the energy features.
+    Uses the GPU when available, otherwise (or if the GPU path fails) librosa on the CPU.
+    """
+    if cuda_available():
+        try:
+            return gpu_magnitude_spectrogram(y, n_fft=n_fft, hop_length=hop_length)
+        except Exception as e:
+            print(f"Warning: GPU spectrogram failed ({e}), falling back to the CPU")
+    return np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+
+def frame_rms(y: np.ndarray, frame_length: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """
+    Compute the same RMS curve as librosa.feature.rms(y=y) (centered frames,
+    zero padding) from a running sum of y**2, without materializing the frames.
+    """
+    pad = frame_length // 2
+    y_padded = np.pad(y.astype(np.float64), (pad, pad), mode='constant')
+    n_frames = 1 + (len(y_padded) - frame_length) // hop_length
+
+    cumulative = np.concatenate(([0.0], np.cumsum(y_padded ** 2)))
+    starts = np.arange(n_frames) * hop_length
+    power = (cumulative[starts + frame_length] - cumulative[starts]) / frame_length
+
+    # Cumulative-sum round-off can leave tiny negatives in silent frames
+    return np.sqrt(np.maximum(power, 0.0)).astype(np.float32)
+
+def analyze_audio_features(y: np.ndarray, S: np.ndarray, sr: int) -> Tuple[np.ndarray, float]:
     """
     Analyze audio features to determine energy levels and dynamic changes.
+    S is the magnitude spectrogram from magnitude_spectrogram.
     Returns energy array and average energy.
     """
-    # Get the RMS energy for each frame
-    hop_length = 512
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+    # Get the RMS energy for each frame from the time-domain signal
+    rms = frame_rms(y)
 
     # Get spectral centroid (brightness/intensity)
-    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+    spectral_centroids = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=N_FFT, hop_length=HOP_LENGTH)[0]
 
-    # Normalize and combine features for overall energy metric
-    rms_normalized = librosa.util.normalize(rms)
-    spec_normalized = librosa.util.normalize(spectral_centroids)
+    # Normalize in place and combine features for overall energy metric
+    rms /= max(rms.max(), 1e-8)
+    spectral_centroids /= max(spectral_centroids.max(), 1e-8)
 
-    energy = (rms_normalized + spec_normalized) / 2
+    energy = np.add(rms, spectral_centroids, out=rms)
+    energy *= 0.5
     average_energy = np.mean(energy)
 
     return energy, average_energy
 
-def determine_segment_points(beat_times: np.ndarray, energy: np.ndarray,
-                           average_energy: float, sr: int, audio_duration: float) -> List[Dict]:
+def beat_track(S: np.ndarray, sr: int) -> Tuple[float, np.ndarray]:
     """
-    Determine optimal segmentation points based on energy levels and musical structure,
-    ensuring total duration matches audio length.
-
-    Parameters:
-        beat_times: Array of beat timestamps
-        energy: Array of energy values
-        average_energy: Average energy level
-        sr: Sample rate
-        audio_duration: Total duration of audio file in seconds
+    Track beats from the shared magnitude spectrogram instead of letting
+    librosa.beat.beat_track run its own STFT. The onset envelope is built the
+    same way beat_track builds it (log-power mel spectrogram, median aggregate).
+    Returns tempo and beat frames.
     """
-    segments = []
-    min_segment_beats = 1  # Minimum segment length in beats
-
-    # Convert energy array to beat-aligned
-    energy_beats = librosa.util.sync(energy.reshape(1, -1),
-                                   librosa.time_to_frames(beat_times, sr=sr),
-                                   aggregate=np.mean)[0]
-
-    # Calculate energy changes between beats
-    energy_changes = np.abs(np.diff(energy_beats))
-    energy_changes = np.append(energy_changes, energy_changes[-1])  # Pad last value
+    mel = librosa.feature.melspectrogram(S=S ** 2, sr=sr)
+    onset_env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr,
+                                             hop_length=HOP_LENGTH, aggregate=np.median)
+    return librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+
+@njit(cache=True, fastmath=True)
+def _segment_indices(beat_times: np.ndarray, high_change: np.ndarray, above_mean_change: np.ndarray,
+                     audio_duration: float, min_segment_beats: int) -> Tuple[np.ndarray, ...]:
+    """
+    Walk the beats and decide where each segment ends.
+    Returns (starts, ends, end_times, durations): segment i covers beats
+    starts[i]..ends[i]-1. The last segment may be cut short to fit the audio.
+    """
+    n_beats = len(beat_times)
+    starts = np.empty(n_beats, dtype=np.int64)
+    ends = np.empty(n_beats, dtype=np.int64)
+    end_times = np.empty(n_beats, dtype=np.float64)
+    durations = np.empty(n_beats, dtype=np.float64)
+    count = 0
 
-    # Initialize variables for segmentation
     current_start = 0
     current_length = 0
-    total_duration = 0
+    total_duration = 0.0
 
-    for i in range(len(beat_times) - 1):
+    for i in range(n_beats - 1):
         current_length += 1
         next_segment_duration = beat_times[i + 1] - beat_times[current_start]
 
@@ -65,45 +123,88 @@ def determine_segment_points(beat_times: np.ndarray, energy: np.ndarray,
             # Calculate remaining time
             remaining_time = audio_duration - total_duration
             if remaining_time >= 1.0:  # Only create segment if at least 1 second remains
-                segment = {
-                    "start": float(beat_times[current_start]),
-                    "end": float(beat_times[current_start] + remaining_time),
-                    "duration": float(remaining_time),
-                    "beats": current_length,
-                    "segment_number": len(segments) + 1,
-                    "energy_level": float(np.mean(energy_beats[current_start:i + 1]))
-                }
-                segments.append(segment)
+                starts[count] = current_start
+                ends[count] = i + 1
+                end_times[count] = beat_times[current_start] + remaining_time
+                durations[count] = remaining_time
+                count += 1
             break
 
         # Normal segmentation conditions
         should_segment = (
-            (energy_changes[i] > np.mean(energy_changes) * 1.5 and current_length >= min_segment_beats) or
+            (high_change[i] and current_length >= min_segment_beats) or
             current_length >= 16 or
-            (current_length in [4, 8] and energy_changes[i] > np.mean(energy_changes))
+            ((current_length == 4 or current_length == 8) and above_mean_change[i])
         )
 
         if should_segment:
-            segment_duration = beat_times[i + 1] - beat_times[current_start]
-
-            # Create segment
-            segment = {
-                "start": float(beat_times[current_start]),
-                "end": float(beat_times[i + 1]),
-                "duration": float(segment_duration),
-                "beats": current_length,
-                "segment_number": len(segments) + 1,
-                "energy_level": float(np.mean(energy_beats[current_start:i + 1]))
-            }
-            segments.append(segment)
+            starts[count] = current_start
+            ends[count] = i + 1
+            end_times[count] = beat_times[i + 1]
+            durations[count] = next_segment_duration
+            count += 1
 
             # Update total duration
-            total_duration += segment_duration
+            total_duration += next_segment_duration
 
             # Reset for next segment
             current_start = i + 1
             current_length = 0
 
+    return starts[:count], ends[:count], end_times[:count], durations[:count]
+
+def determine_segment_points(beat_times: np.ndarray, energy: np.ndarray,
+                           average_energy: float, sr: int, audio_duration: float) -> List[Dict]:
+    """
+    Determine optimal segmentation points based on energy levels and musical structure,
+    ensuring total duration matches audio length.
+
+    Parameters:
+        beat_times: Array of beat timestamps
+        energy: Array of energy values
+        average_energy: Average energy level
+        sr: Sample rate
+        audio_duration: Total duration of audio file in seconds
+    """
+    segments = []
+    min_segment_beats = 1  # Minimum segment length in beats
+
+    # Convert energy array to beat-aligned: average the frames between
+    # consecutive beats (plus the span before the first beat) in one reduce
+    beat_frames = librosa.time_to_frames(beat_times, sr=sr, hop_length=HOP_LENGTH)
+    boundaries = np.unique(np.concatenate(([0], beat_frames)))
+    boundaries = boundaries[(boundaries >= 0) & (boundaries < energy.size)]
+    counts = np.diff(np.append(boundaries, energy.size))
+    energy_beats = np.add.reduceat(energy, boundaries) / counts
+
+    # Calculate energy changes between beats
+    energy_changes = np.abs(np.diff(energy_beats))
+    energy_changes = np.append(energy_changes, energy_changes[-1])  # Pad last value
+
+    # Precompute thresholds and running sums so each step of the beat walk is O(1)
+    mean_change = energy_changes.mean()
+    high_change = energy_changes > mean_change * 1.5
+    above_mean_change = energy_changes > mean_change
+    cumulative_energy = np.concatenate(([0.0], np.cumsum(energy_beats)))
+
+    # Walk the beats in compiled code, then build the segment dicts
+    # (NumPy scalars are left as-is; save_analysis serializes them with orjson)
+    starts, ends, end_times, durations = _segment_indices(
+        beat_times.astype(np.float64), high_change, above_mean_change,
+        float(audio_duration), min_segment_beats
+    )
+    energy_levels = (cumulative_energy[ends] - cumulative_energy[starts]) / (ends - starts)
+
+    for n in range(len(starts)):
+        segments.append({
+            "start": beat_times[starts[n]],
+            "end": end_times[n],
+            "duration": durations[n],
+            "beats": ends[n] - starts[n],
+            "segment_number": n + 1,
+            "energy_level": energy_levels[n]
+        })
+
     # Validate total duration
     total_segment_duration = sum(segment["duration"] for segment in segments)
     if abs(total_segment_duration - audio_duration) > 0.1:  # Allow 0.1s tolerance
@@ -122,12 +223,15 @@ def analyze_audio(file_path: str) -> Dict:
     # Calculate audio duration
     audio_duration = librosa.get_duration(y=y, sr=sr)
 
+    # Compute one spectrogram for both beat tracking and energy features
+    S = magnitude_spectrogram(y)
+
     # Get tempo and beat frames
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+    tempo, beat_frames = beat_track(S, sr)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=HOP_LENGTH)
 
     # Analyze energy and features
-    energy, average_energy = analyze_audio_features(y, sr)
+    energy, average_energy = analyze_audio_features(y, S, sr)
 
     # Generate segments based on analysis
     segments = determine_segment_points(beat_times, energy, average_energy, sr, audio_duration)
@@ -146,8 +250,8 @@ def save_analysis(analysis: Dict, audio_path: str) -> str:
     Save analysis results to a JSON file with the same name as the audio file.
     """
     json_path = os.path.splitext(audio_path)[0] + '.json'
-    with open(json_path, 'w') as f:
-        json.dump(analysis, f, indent=2)
+    with open(json_path, 'wb') as f:
+        f.write(orjson.dumps(analysis, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     return json_path
 
 def main():
@@ -13,6 +13,7 @@ display_help() {
     echo "  -h, --height              Output video height (default: 720)"
     echo "  -d, --video-dirs          Comma-separated list of directories containing input video files"
     echo "  -t, --temp-dir            Directory for temporary files (default: system temp)"
+    echo "  -g, --hwaccel             Hardware encoder to use: nvenc, vaapi or vt (default: libx264)"
     echo
     echo "Example:"
     echo "  $0 -a 'mp3,wav,m4a' -v 'mp4,avi,mov' -w 1920 -h 1080 -d './videos1,./videos2,./videos3' -t ./temp ./input_folder ./output_folder"
@@ -28,6 +29,7 @@ audio_extensions=""
 video_extensions=""
 video_dirs=""
 temp_dir=""
+hwaccel=""
 
 # Parse command line arguments
 while [[ $# -gt 0 ]]; do
@@ -60,6 +62,10 @@ while [[ $# -gt 0 ]]; do
             temp_dir="$2"
             shift 2
             ;;
+        -g|--hwaccel)
+            hwaccel="$2"
+            shift 2
+            ;;
         -*)
             echo "Error: Unknown option $1"
             display_help
@@ -88,6 +94,7 @@ echo "width: $width"
 echo "height: $height"
 echo "video_dirs: $video_dirs"
 echo "temp_dir: $temp_dir"
+echo "hwaccel: $hwaccel"
 echo "input_dir: $input_dir"
 echo "output_dir: $output_dir"
 
@@ -200,6 +207,9 @@ for file in "${all_files[@]}"; do
     if [ ! -z "$temp_dir" ]; then
         video_editor_cmd+=" --temp-dir \"$temp_dir\""
     fi
+    if [ ! -z "$hwaccel" ]; then
+        video_editor_cmd+=" --hwaccel \"$hwaccel\""
+    fi
 
     echo "Running command: $video_editor_cmd"
 
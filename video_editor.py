@@ -1,8 +1,10 @@
+import asyncio
 import json
 import random
 import os
 import subprocess
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import tempfile
 import shlex
 import sys
@@ -18,8 +20,12 @@ logger = logging.getLogger(__name__)
 def get_audio_duration(audio_path):
     """
     Get audio file duration using ffprobe.
-    Returns duration in seconds.
+    Returns duration in seconds. Results are cached per resolved path.
     """
+    return _probe_audio_duration(os.path.realpath(audio_path))
+
+@lru_cache(maxsize=None)
+def _probe_audio_duration(audio_path):
     logger.info(f"Getting audio duration for: {audio_path}")
 
     try:
@@ -30,10 +36,11 @@ def get_audio_duration(audio_path):
             audio_path
         ]
         logger.debug("Executing audio duration command...")
-        logger.debug(f"Command: {format_command(duration_cmd)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Command: %s", format_command(duration_cmd))
 
         duration_output = subprocess.check_output(duration_cmd, stderr=subprocess.PIPE)
-        logger.debug(f"Duration command raw output: {duration_output}")
+        logger.debug("Duration command raw output: %s", duration_output)
 
         duration = float(duration_output.decode().strip())
         logger.info(f"Audio duration: {duration:.2f} seconds")
@@ -51,36 +58,58 @@ def get_audio_duration(audio_path):
 
 def format_command(cmd):
     """Format a command list into a readable shell command string"""
-    formatted = ' '.join(shlex.quote(str(arg)) for arg in cmd)
-    logger.debug(f"Formatted command: {formatted}")
-    return formatted
+    return ' '.join(shlex.quote(str(arg)) for arg in cmd)
 
-def calculate_crop_params(source_width, source_height, target_width, target_height):
+def calculate_crop_params(source_width, source_height, target_width, target_height, hwaccel=None):
     """
     Calculate scaling and cropping parameters to maintain aspect ratio from center.
-    Handles both landscape and portrait videos by scaling up first if needed.
+    Sources at least as large as the target are cropped and scaled once; smaller
+    ones are scaled up first. Handles both landscape and portrait videos.
+    With hwaccel='cuda' the chain runs on CUDA frames instead.
     Returns filter string for ffmpeg
     """
     logger.info(f"Calculating parameters for {source_width}x{source_height} -> {target_width}x{target_height}")
 
+    if hwaccel == 'cuda':
+        # Scale on the GPU to cover the target, then center crop; frames stay in VRAM.
+        # Convert to 8-bit 4:2:0 like the CPU chain, since NVENC H.264 can't take P010
+        filter_string = (f"scale_cuda={target_width}:{target_height}:force_original_aspect_ratio=increase"
+                         f":format=yuv420p,crop={target_width}:{target_height}")
+        logger.info(f"Calculated filter chain: {filter_string}")
+        return filter_string
+
     source_aspect = source_width / source_height
     target_aspect = target_width / target_height
-    logger.debug(f"Source aspect: {source_aspect:.3f}, Target aspect: {target_aspect:.3f}")
+    logger.debug("Source aspect: %.3f, Target aspect: %.3f", source_aspect, target_aspect)
+
+    # If the source covers the target, crop straight from the source and scale once
+    if source_width >= target_width and source_height >= target_height:
+        if source_aspect > target_aspect:
+            # Source is wider - crop width
+            new_width = int(source_height * target_aspect)
+            crop_x = (source_width - new_width) // 2
+            filter_chain = [f"crop={new_width}:{source_height}:{crop_x}:0"]
+        elif source_aspect < target_aspect:
+            # Source is taller - crop height
+            new_height = int(source_width / target_aspect)
+            crop_y = (source_height - new_height) // 2
+            filter_chain = [f"crop={source_width}:{new_height}:0:{crop_y}"]
+        else:
+            filter_chain = []
+        filter_chain += [f"scale={target_width}:{target_height}", "format=yuv420p"]
 
-    # First, determine if we need to scale up
-    scale_width = source_width
-    scale_height = source_height
+        filter_string = ','.join(filter_chain)
+        logger.info(f"Calculated filter chain: {filter_string}")
+        return filter_string
 
-    # If source dimensions are smaller than target, scale up first
-    if source_width < target_width or source_height < target_height:
-        # Scale based on the dimension that needs the larger scaling factor
-        width_scale = target_width / source_width
-        height_scale = target_height / source_height
-        scale_factor = max(width_scale, height_scale)
+    # Otherwise scale up first, based on the dimension that needs the larger scaling factor
+    width_scale = target_width / source_width
+    height_scale = target_height / source_height
+    scale_factor = max(width_scale, height_scale)
 
-        scale_width = int(source_width * scale_factor)
-        scale_height = int(source_height * scale_factor)
-        logger.debug(f"Scaling to intermediate size: {scale_width}x{scale_height}")
+    scale_width = int(source_width * scale_factor)
+    scale_height = int(source_height * scale_factor)
+    logger.debug("Scaling to intermediate size: %dx%d", scale_width, scale_height)
 
     # Now calculate crop after scaling
     if source_aspect > target_aspect:
@@ -116,53 +145,54 @@ def calculate_crop_params(source_width, source_height, target_width, target_heig
 def get_video_info(video_path):
     """
     Get video duration and dimensions using ffprobe.
+    Returns (duration, width, height). Results are cached per resolved path.
+    """
+    return _probe_video_info(os.path.realpath(video_path))
+
+def get_probe_cmd(video_path):
+    """Build the ffprobe command that reads duration and dimensions in a single probe"""
+    return [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'format=duration:stream=width,height',
+        '-of', 'default=noprint_wrappers=1',  # Plain "key=value" lines
+        video_path
+    ]
+
+def parse_video_info(probe_output, video_path):
+    """
+    Parse ffprobe output from get_probe_cmd.
     Returns (duration, width, height)
     """
-    logger.info(f"Getting video info for: {video_path}")
+    logger.debug("Probe command raw output: %s", probe_output)
 
-    try:
-        # Get duration
-        duration_cmd = [
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            video_path
-        ]
-        logger.debug("Executing duration command...")
-        logger.debug(f"Command: {format_command(duration_cmd)}")
+    info = dict(line.split('=', 1) for line in probe_output.decode().splitlines() if '=' in line)
 
-        duration_output = subprocess.check_output(duration_cmd, stderr=subprocess.PIPE)
-        logger.debug(f"Duration command raw output: {duration_output}")
-
-        duration = float(duration_output.decode().strip())
-        logger.info(f"Video duration: {duration:.2f} seconds")
+    duration = float(info['duration'])
+    logger.info(f"Video duration: {duration:.2f} seconds")
 
-        # Get dimensions
-        dimension_cmd = [
-            'ffprobe', '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'json',
-            video_path
-        ]
-        logger.debug("Executing dimension command...")
-        logger.debug(f"Command: {format_command(dimension_cmd)}")
+    if 'width' not in info or 'height' not in info:
+        logger.error(f"No video streams found in {video_path}")
+        raise ValueError(f"No video streams found in {video_path}")
 
-        dimension_output = subprocess.check_output(dimension_cmd, stderr=subprocess.PIPE)
-        logger.debug(f"Dimension command raw output: {dimension_output}")
+    width = int(info['width'])
+    height = int(info['height'])
+    logger.info(f"Video dimensions: {width}x{height}")
 
-        dimensions = json.loads(dimension_output.decode())
-        logger.debug(f"Parsed dimensions JSON: {dimensions}")
+    return duration, width, height
 
-        if not dimensions.get('streams'):
-            logger.error(f"No video streams found in {video_path}")
-            raise ValueError(f"No video streams found in {video_path}")
+@lru_cache(maxsize=None)
+def _probe_video_info(video_path):
+    logger.info(f"Getting video info for: {video_path}")
 
-        width = int(dimensions['streams'][0]['width'])
-        height = int(dimensions['streams'][0]['height'])
-        logger.info(f"Video dimensions: {width}x{height}")
+    try:
+        probe_cmd = get_probe_cmd(video_path)
+        logger.debug("Executing probe command...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Command: %s", format_command(probe_cmd))
 
-        return duration, width, height
+        probe_output = subprocess.check_output(probe_cmd, stderr=subprocess.PIPE)
+        return parse_video_info(probe_output, video_path)
 
     except subprocess.CalledProcessError as e:
         logger.error(f"FFprobe command failed for {video_path}")
@@ -173,6 +203,48 @@ def get_video_info(video_path):
         logger.error(f"Unexpected error processing {video_path}: {str(e)}")
         raise
 
+async def _probe_video_info_async(video_path, semaphore):
+    """
+    Probe one video without blocking the event loop.
+    Returns (video_path, (duration, width, height)), or (video_path, None) if probing failed.
+    """
+    async with semaphore:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *get_probe_cmd(video_path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode().strip() or f"ffprobe exited with code {process.returncode}")
+
+            return video_path, parse_video_info(stdout, video_path)
+
+        except Exception as e:
+            logger.warning(f"Skipping video that could not be probed: {video_path} ({e})")
+            return video_path, None
+
+async def _probe_all_async(video_paths, max_concurrent):
+    semaphore = asyncio.Semaphore(max_concurrent)
+    return await asyncio.gather(*[_probe_video_info_async(path, semaphore) for path in video_paths])
+
+def probe_all(video_paths, max_concurrent=64):
+    """
+    Probe all source videos up front, running ffprobe processes concurrently
+    on an asyncio event loop. Use get_video_info for single files.
+    Returns a dict mapping path -> (duration, width, height). Videos that
+    can't be probed are left out.
+    """
+    logger.info(f"Probing {len(video_paths)} source videos")
+
+    results = asyncio.run(_probe_all_async(video_paths, max_concurrent))
+
+    video_info = {path: info for path, info in results if info is not None}
+    logger.info(f"Probed {len(video_info)}/{len(video_paths)} source videos successfully")
+    return video_info
+
 def find_video_files(folders, extensions):
     """
     Recursively find all video files with given extensions in multiple folders and their subfolders.
@@ -196,29 +268,25 @@ def find_video_files(folders, extensions):
     logger.debug(f"Looking for extensions: {extensions}")
 
     video_files = []
-    ext_list = extensions.lower().split(',')
+    # Match case-insensitively; duplicates like "mp4,MP4" collapse to one suffix
+    ext_tuple = tuple(sorted({'.' + ext.strip().lower() for ext in extensions.split(',') if ext.strip()}))
 
     try:
         for folder in folder_list:
             logger.info(f"Searching in folder: {folder}")
-            # Convert to Path object
-            folder_path = Path(folder)
 
-            if not folder_path.exists():
+            if not os.path.isdir(folder):
                 logger.warning(f"Folder does not exist: {folder}")
                 continue
 
-            # Search for each extension
-            for ext in ext_list:
-                # Search lowercase extensions
-                files = list(folder_path.rglob(f"*.{ext}"))
-                logger.debug(f"Found {len(files)} files with extension .{ext} in {folder}")
-                video_files.extend(str(f) for f in files)
-
-                # Search uppercase extensions
-                files = list(folder_path.rglob(f"*.{ext.upper()}"))
-                logger.debug(f"Found {len(files)} files with extension .{ext.upper()} in {folder}")
-                video_files.extend(str(f) for f in files)
+            # Single walk over the tree, checking every file against all extensions
+            folder_count = 0
+            for root, _, files in os.walk(folder):
+                for name in files:
+                    if name.lower().endswith(ext_tuple):
+                        video_files.append(os.path.join(root, name))
+                        folder_count += 1
+            logger.debug(f"Found {folder_count} files with extensions {ext_tuple} in {folder}")
 
         logger.info(f"Found {len(video_files)} total video files across all folders")
         logger.debug("First few files found: " +
@@ -241,7 +309,8 @@ def run_ffmpeg_command(cmd, input_file, output_file, timeout=60):
     """
     logger.info(f"Running FFmpeg command for input: {input_file}")
     logger.info(f"Output will be written to: {output_file}")
-    logger.debug(f"Full command: {format_command(cmd)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Full command: %s", format_command(cmd))
 
     try:
         # Start the FFmpeg process
@@ -255,13 +324,13 @@ def run_ffmpeg_command(cmd, input_file, output_file, timeout=60):
 
         try:
             # Wait for the process with timeout
-            logger.debug(f"Waiting for FFmpeg process to complete (timeout: {timeout}s)...")
+            logger.debug("Waiting for FFmpeg process to complete (timeout: %ss)...", timeout)
             stdout, stderr = process.communicate(timeout=timeout)
 
             if stdout:
-                logger.debug(f"FFmpeg stdout: {stdout}")
+                logger.debug("FFmpeg stdout: %s", stdout)
             if stderr:
-                logger.debug(f"FFmpeg stderr: {stderr}")
+                logger.debug("FFmpeg stderr: %s", stderr)
 
             if process.returncode != 0:
                 logger.error(f"FFmpeg command failed with return code: {process.returncode}")
@@ -299,58 +368,384 @@ def run_ffmpeg_command(cmd, input_file, output_file, timeout=60):
         logger.error(f"Error running FFmpeg command: {str(e)}")
         return False
 
-def process_segment(segment, i, video_files, temp_dir, output_width, output_height, max_retries=3):
+# H.264 encoder to use for each --hwaccel option
+HWACCEL_ENCODERS = {
+    'nvenc': 'h264_nvenc',
+    'vaapi': 'h264_vaapi',
+    'vt': 'h264_videotoolbox',
+    None: 'libx264',
+}
+
+# Internal mode for --hwaccel nvenc when ffmpeg has the CUDA filters: decode,
+# filter and encode all on the GPU. Plain 'nvenc' filters on the CPU
+CUDA_PIPELINE = 'cuda'
+
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# Hardware encoders limit concurrent sessions (consumer NVIDIA cards allow only a
+# few), so with --hwaccel the number of encoders running at once is capped here
+MAX_HW_ENCODERS = 3
+
+@lru_cache(maxsize=None)
+def get_available_encoders():
+    """
+    List the encoders compiled into the local ffmpeg build.
+    Returns a set of encoder names.
+    """
+    cmd = ['ffmpeg', '-hide_banner', '-encoders']
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Command: %s", format_command(cmd))
+
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.PIPE).decode()
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Could not list ffmpeg encoders: {e}")
+        return frozenset()
+
+    encoders = set()
+    for line in output.splitlines():
+        # Encoder lines look like " V....D libx264   libx264 H.264 / AVC ..."
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+@lru_cache(maxsize=None)
+def get_available_filters():
+    """
+    List the filters compiled into the local ffmpeg build.
+    Returns a set of filter names.
+    """
+    cmd = ['ffmpeg', '-hide_banner', '-filters']
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Command: %s", format_command(cmd))
+
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.PIPE).decode()
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.error(f"Could not list ffmpeg filters: {e}")
+        return frozenset()
+
+    filters = set()
+    for line in output.splitlines():
+        # Filter lines look like " ..C scale_cuda   V->V   GPU accelerated video resizer"
+        parts = line.split()
+        if len(parts) >= 3 and '->' in parts[2]:
+            filters.add(parts[1])
+    return frozenset(filters)
+
+@lru_cache(maxsize=None)
+def cuda_pipeline_works(output_width, output_height):
+    """
+    Run a one-frame test through the exact CUDA chain used for segments: NVDEC
+    decode of a small H.264 clip, the scale_cuda/crop filters and NVENC.
+    The clip is square so the chain has to both scale and crop.
+    Returns True if ffmpeg succeeds and the output has the target dimensions.
+    """
+    sample_size = 640
+    with tempfile.TemporaryDirectory() as test_dir:
+        sample_file = os.path.join(test_dir, 'sample.mp4')
+        output_file = os.path.join(test_dir, 'output.ts')
+
+        sample_cmd = [
+            'ffmpeg', '-y',
+            '-v', 'error',
+            '-f', 'lavfi',
+            '-i', f'testsrc2=size={sample_size}x{sample_size}:rate=25',
+            '-frames:v', '1',
+            *get_encoder_args('nvenc'),
+            '-pix_fmt', 'yuv420p',
+            sample_file
+        ]
+        test_cmd = [
+            'ffmpeg', '-y',
+            '-v', 'error',
+            *get_hwaccel_decode_args(CUDA_PIPELINE),
+            '-i', sample_file,
+            '-vf', get_segment_filter(sample_size, sample_size, output_width, output_height, CUDA_PIPELINE),
+            '-frames:v', '1',
+            *get_segment_output_args({'duration': 1}, CUDA_PIPELINE),
+            output_file
+        ]
+        probe_cmd = [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height',
+            '-of', 'csv=p=0:s=x',
+            output_file
+        ]
+
+        try:
+            for cmd in (sample_cmd, test_cmd):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Command: %s", format_command(cmd))
+                subprocess.run(cmd, check=True, capture_output=True, timeout=60)
+            output_size = subprocess.check_output(probe_cmd, stderr=subprocess.PIPE, timeout=60).decode().strip()
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"CUDA test encode failed: {e.stderr.decode(errors='replace').strip()}")
+            return False
+        except (subprocess.TimeoutExpired, OSError) as e:
+            logger.warning(f"CUDA test encode failed: {e}")
+            return False
+
+    if output_size != f"{output_width}x{output_height}":
+        logger.warning(f"CUDA test encode produced {output_size or 'no video'}, "
+                       f"expected {output_width}x{output_height}")
+        return False
+    return True
+
+def resolve_hwaccel(hwaccel, output_width, output_height):
+    """
+    Check that the encoder for the requested hardware acceleration is available.
+    For 'nvenc', also check for the CUDA filters and return CUDA_PIPELINE if they
+    are present and a test encode at the output size succeeds, so frames stay on the GPU.
+    Returns the mode to use, or None to fall back to libx264.
+    """
+    if hwaccel is None:
+        return None
+
+    encoder = HWACCEL_ENCODERS[hwaccel]
+    if encoder not in get_available_encoders():
+        logger.warning(f"Encoder {encoder} is not available in this ffmpeg build, falling back to libx264")
+        return None
+
+    logger.info(f"Using hardware encoder: {encoder}")
+
+    if hwaccel == 'nvenc':
+        if 'scale_cuda' not in get_available_filters():
+            logger.warning("Filter scale_cuda is not available in this ffmpeg build, filtering on the CPU")
+        elif not cuda_pipeline_works(output_width, output_height):
+            logger.warning("CUDA decoding and filters don't work on this system, filtering on the CPU")
+        else:
+            logger.info("Using CUDA decoding and filters with NVENC")
+            return CUDA_PIPELINE
+
+    return hwaccel
+
+def get_hwaccel_input_args(hwaccel):
+    """Return global ffmpeg arguments that must appear before any input for the given hwaccel"""
+    if hwaccel == 'vaapi':
+        return ['-vaapi_device', VAAPI_DEVICE]
+    return []
+
+def get_hwaccel_decode_args(hwaccel):
+    """Return per-input ffmpeg arguments that must appear before each -i for the given hwaccel"""
+    if hwaccel == CUDA_PIPELINE:
+        # Decode with NVDEC and keep frames in GPU memory through the filters and NVENC
+        return ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+    return []
+
+def get_encoder_args(hwaccel):
+    """Return ffmpeg video codec arguments for the given hwaccel"""
+    if hwaccel in ('nvenc', CUDA_PIPELINE):
+        return [
+            '-c:v', 'h264_nvenc',
+            '-preset', 'p4',
+            '-rc', 'vbr',
+            '-cq', '23',
+            '-b:v', '0',
+            '-forced-idr', '1',  # Forced keyframes are IDR so segments can be stream-copied
+        ]
+    if hwaccel == 'vaapi':
+        return ['-c:v', 'h264_vaapi', '-qp', '23']
+    if hwaccel == 'vt':
+        return ['-c:v', 'h264_videotoolbox', '-b:v', '8M']
+    return [
+        '-c:v', 'libx264',
+        '-preset', 'medium',
+        '-crf', '23',
+        '-x264-params', 'scenecut=0:open-gop=0',  # Closed GOPs so segments can be stream-copied
+    ]
+
+def get_parallel_settings(hwaccel=None):
+    """
+    Split available CPU cores between concurrent FFmpeg jobs and encoder threads.
+    Each job encodes up to segments_per_process segments at once; with a hardware
+    encoder, workers and batch size shrink so at most MAX_HW_ENCODERS run together.
+    Returns (max_workers, segments_per_process, threads_per_job)
+    """
+    cpu_count = os.cpu_count() or 1
+    max_workers = max(1, cpu_count // 2)
+    segments_per_process = MAX_SEGMENTS_PER_PROCESS
+    if hwaccel is not None:
+        max_workers = min(max_workers, MAX_HW_ENCODERS)
+        segments_per_process = max(1, min(segments_per_process, MAX_HW_ENCODERS // max_workers))
+    threads_per_job = max(1, cpu_count // max_workers)
+    logger.debug(f"Parallel settings: {max_workers} workers, {segments_per_process} segments per job, "
+                 f"{threads_per_job} threads per job")
+    return max_workers, segments_per_process, threads_per_job
+
+def get_segment_filter(source_width, source_height, output_width, output_height, hwaccel=None):
+    """
+    Build the filter chain for one segment: crop/scale to the output size,
+    reset timestamps and upload to the GPU when encoding with VAAPI.
+    """
+    filter_string = calculate_crop_params(source_width, source_height, output_width, output_height, hwaccel)
+
+    # Add timestamp correction to filter chain
+    filter_string += ',setpts=PTS-STARTPTS'  # Reset timestamps to start at 0
+
+    if hwaccel == 'vaapi':
+        # Upload filtered frames to the VAAPI device for encoding
+        filter_string += ',format=nv12,hwupload'
+
+    return filter_string
+
+def get_segment_output_args(segment, hwaccel=None, threads=None):
+    """
+    Build the ffmpeg output options shared by every encoded segment, so all
+    segments can be joined by stream copy. The output path is not included.
+    """
+    output_args = [
+        '-t', str(segment['duration']),
+        *get_encoder_args(hwaccel),
+    ]
+    if hwaccel not in ('vaapi', CUDA_PIPELINE):
+        # VAAPI and CUDA frames are already in the device's hardware format
+        output_args += ['-pix_fmt', 'yuv420p']
+    output_args += [
+        '-color_range', '1',
+        '-colorspace', 'bt709',
+        '-color_primaries', 'bt709',
+        '-color_trc', 'bt709',
+        '-force_key_frames', f"expr:gte(t,0+n_forced*{segment['duration']})",  # Force keyframe at start
+        '-fps_mode', 'cfr',  # Ensure timestamp consistency
+        '-async', '1',  # Audio sync
+        '-f', 'mpegts',  # MPEG-TS segments can be joined byte-for-byte
+        '-bsf:v', 'h264_mp4toannexb',
+        '-an',  # No audio
+    ]
+    if threads:
+        # Cap encoder threads so parallel jobs don't oversubscribe the CPU
+        output_args += ['-threads', str(threads)]
+    return output_args
+
+def get_decoder_thread_args(threads=None):
+    """Return per-input ffmpeg arguments that cap decoder threads, placed before -i"""
+    if threads:
+        return ['-threads', str(threads)]
+    return []
+
+def get_segment_file_path(temp_dir, i):
+    """Return a unique MPEG-TS path for segment i"""
+    unique_id = ''.join(random.choices('0123456789abcdef', k=6))
+    return os.path.join(temp_dir, f'segment_video_file_{i}_{unique_id}.ts')
+
+def pick_start_time(video_duration, segment_duration, rng=random):
+    """Pick a random start point that leaves room for the whole segment"""
+    max_start = max(0, video_duration - segment_duration)
+    return rng.uniform(0, max_start) if max_start > 0 else 0
+
+# Each segment is a separate encoder in the ffmpeg process, so memory grows with
+# the number of segments per call; larger groups are split into batches of this size
+MAX_SEGMENTS_PER_PROCESS = 4
+
+def process_source_segments(source_video, assigned_segments, temp_dir, output_width, output_height,
+                            threads=None, video_info=None, hwaccel=None):
     """
-    Process a single segment with retry logic and timestamp handling
+    Extract every segment assigned to one source video with a single ffmpeg
+    process: one seeked input and one encoded output per segment.
+    assigned_segments is a list of (i, segment, start_time).
+    Returns a list of (i, segment_file_path) with None for segments that failed.
+    """
+    logger.info(f"Processing {len(assigned_segments)} segments from: {source_video}")
+
+    try:
+        if video_info and source_video in video_info:
+            _, source_width, source_height = video_info[source_video]
+        else:
+            _, source_width, source_height = get_video_info(source_video)
+
+        filter_string = get_segment_filter(source_width, source_height, output_width, output_height, hwaccel)
+
+        # The job's thread budget is shared by every decoder and encoder in the process
+        if threads:
+            threads = max(1, threads // len(assigned_segments))
+
+        extract_cmd = [
+            'ffmpeg', '-y',
+            '-v', 'warning',
+            *get_hwaccel_input_args(hwaccel),
+        ]
+        for _, segment, start_time in assigned_segments:
+            extract_cmd += [
+                *get_hwaccel_decode_args(hwaccel),
+                *get_decoder_thread_args(threads),
+                '-ss', str(start_time),
+                '-i', source_video
+            ]
+
+        segment_files = []
+        for input_index, (i, segment, _) in enumerate(assigned_segments):
+            segment_file = get_segment_file_path(temp_dir, i)
+            segment_files.append(segment_file)
+            extract_cmd += [
+                '-map', f'{input_index}:v:0',
+                '-vf', filter_string,
+                *get_segment_output_args(segment, hwaccel, threads),
+                segment_file
+            ]
+
+        timeout = 100 * len(assigned_segments)
+        if run_ffmpeg_command(extract_cmd, source_video, segment_files[-1], timeout=timeout):
+            return [(i, segment_file) for (i, _, _), segment_file in zip(assigned_segments, segment_files)]
+
+        # Drop any partial outputs so the segments can be retried individually
+        for segment_file in segment_files:
+            if os.path.exists(segment_file):
+                os.remove(segment_file)
+
+    except Exception as e:
+        logger.error(f"Error processing segments from {source_video}: {e}")
+
+    return [(i, None) for i, _, _ in assigned_segments]
+
+def process_segment(segment, i, source_video, temp_dir, output_width, output_height, fallback_pool=None,
+                    start_time=None, max_retries=3, threads=None, video_info=None, hwaccel=None):
+    """
+    Process a single segment with retry logic and timestamp handling.
+    The first attempt uses the assigned source_video (and start_time, if given);
+    later attempts pick a random video from fallback_pool.
     Returns (success, segment_file_path)
     """
     for attempt in range(max_retries):
         try:
             logger.info(f"Processing segment {i+1}, attempt {attempt+1}/{max_retries}")
 
-            # Select random video
-            source_video = random.choice(video_files)
+            if attempt > 0:
+                if not fallback_pool:
+                    break
+                # Previous attempt failed, select a random video instead
+                source_video = random.choice(fallback_pool)
+                start_time = None
             logger.info(f"Selected video: {source_video}")
 
-            # Get video information
-            video_duration, source_width, source_height = get_video_info(source_video)
+            # Get video information, preferring the up-front probe results
+            if video_info and source_video in video_info:
+                video_duration, source_width, source_height = video_info[source_video]
+            else:
+                video_duration, source_width, source_height = get_video_info(source_video)
 
-            # Calculate random start point
-            max_start = max(0, video_duration - segment['duration'])
-            start_time = random.uniform(0, max_start) if max_start > 0 else 0
+            # Calculate random start point unless one was assigned
+            if start_time is None:
+                start_time = pick_start_time(video_duration, segment['duration'])
 
-            # Generate unique identifier
-            unique_id = ''.join(random.choices('0123456789abcdef', k=6))
-            segment_file = os.path.join(temp_dir, f'segment_video_file_{i}_{unique_id}.mp4')
+            segment_file = get_segment_file_path(temp_dir, i)
 
             # Get filter chain
-            filter_string = calculate_crop_params(source_width, source_height, output_width, output_height)
-
-            # Add timestamp correction to filter chain
-            filter_string += ',setpts=PTS-STARTPTS'  # Reset timestamps to start at 0
+            filter_string = get_segment_filter(source_width, source_height, output_width, output_height, hwaccel)
 
             # Extract segment using ffmpeg with consistent timestamp settings
             extract_cmd = [
                 'ffmpeg', '-y',
                 '-v', 'warning',
+                *get_hwaccel_input_args(hwaccel),
+                *get_hwaccel_decode_args(hwaccel),
+                *get_decoder_thread_args(threads),
                 '-ss', str(start_time),
                 '-i', source_video,
-                '-t', str(segment['duration']),
                 '-vf', filter_string,
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                '-video_track_timescale', '30000',  # Consistent timescale
-                '-pix_fmt', 'yuv420p',
-                '-color_range', '1',
-                '-colorspace', 'bt709',
-                '-color_primaries', 'bt709',
-                '-color_trc', 'bt709',
-                '-force_key_frames', f"expr:gte(t,0+n_forced*{segment['duration']})",  # Force keyframe at start
-                '-fps_mode', 'cfr',  # Ensure timestamp consistency
-                '-async', '1',  # Audio sync
-                '-movflags', '+faststart+empty_moov',
-                '-an',  # No audio
+                *get_segment_output_args(segment, hwaccel, threads),
                 segment_file
             ]
 
@@ -371,7 +766,6 @@ import json
 import random
 import os
 import subprocess
-from pathlib import Path
 import tempfile
 import shlex
 import sys
@@ -381,7 +775,8 @@ import logging
 
 # [Previous helper functions remain the same until create_edited_video]
 
-def create_edited_video(segments_file, video_folder, output_file, output_width, output_height, audio_file=None, extensions="mp4,mov,mkv,avi", temp_dir=None):
+def create_edited_video(segments_file, video_folder, output_file, output_width, output_height, audio_file=None, extensions="mp4,mov,mkv,avi", temp_dir=None,
+                        hwaccel=None, seed=None):
     """
     Creates an edited video based on JSON segments file and source videos.
     Optionally includes a custom audio track.
@@ -395,6 +790,9 @@ def create_edited_video(segments_file, video_folder, output_file, output_width,
         audio_file: Optional path to audio file to use as soundtrack
         extensions: Comma-separated list of video file extensions to include
         temp_dir: Optional custom temporary directory path. If None, creates a new temp directory
+        hwaccel: Optional hardware encoder to use ('nvenc', 'vaapi' or 'vt'). Falls back to libx264
+            if the encoder isn't available
+        seed: Optional random seed; the same seed and inputs produce the same segment selection
     """
     logger.info(f"Starting video creation process")
     logger.info(f"Segments file: {segments_file}")
@@ -428,6 +826,15 @@ def create_edited_video(segments_file, video_folder, output_file, output_width,
     if not video_files:
         raise ValueError(f"No videos with extensions {extensions} found in {video_folder} or its subdirectories")
 
+    hwaccel = resolve_hwaccel(hwaccel, output_width, output_height)
+
+    # Probe every source video once before processing segments
+    video_info = probe_all(video_files)
+    video_files = [video for video in video_files if video in video_info]
+
+    if not video_files:
+        raise ValueError(f"None of the videos found in {video_folder} could be probed")
+
     # Context manager for temporary directory handling
     class TempDirManager:
         def __init__(self, custom_temp_dir=None):
@@ -458,11 +865,64 @@ def create_edited_video(segments_file, video_folder, output_file, output_width,
         segment_files = []
         failed_segments = []
 
-        # Process each segment
-        for i, segment in enumerate(segments):
-            success, segment_file = process_segment(segment, i, video_files, working_dir,
-                                                output_width, output_height)
-            if success and segment_file:
+        # Pick every segment's source video and start point up front, so a given seed
+        # reproduces the same edit, then group segments by source so each source is
+        # handled by as few ffmpeg processes as memory allows. Draw from a sorted list,
+        # since os.walk order depends on the filesystem
+        rng = random.Random(seed)
+        candidates = sorted(video_files)
+        assignments = [rng.choice(candidates) for _ in segments]
+        start_times = [pick_start_time(video_info[source_video][0], segment['duration'], rng)
+                       for source_video, segment in zip(assignments, segments)]
+
+        segments_by_source = {}
+        for i, (segment, source_video) in enumerate(zip(segments, assignments)):
+            segments_by_source.setdefault(source_video, []).append((i, segment, start_times[i]))
+
+        max_workers, segments_per_process, threads_per_job = get_parallel_settings(hwaccel)
+
+        source_batches = []
+        for source_video, assigned in segments_by_source.items():
+            for n in range(0, len(assigned), segments_per_process):
+                source_batches.append((source_video, assigned[n:n + segments_per_process]))
+
+        # Process sources in parallel; FFmpeg runs out of process so threads are enough
+        logger.info(f"Processing {len(segments)} segments from {len(segments_by_source)} source videos "
+                    f"in {len(source_batches)} ffmpeg calls with {max_workers} parallel jobs")
+        results = [None] * len(segments)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            source_results = executor.map(
+                lambda item: process_source_segments(item[0], item[1], working_dir, output_width, output_height,
+                                                     threads=threads_per_job, video_info=video_info,
+                                                     hwaccel=hwaccel),
+                source_batches
+            )
+            for source_result in source_results:
+                for i, segment_file in source_result:
+                    results[i] = segment_file
+
+            # Retry segments whose source failed individually; each retry starts with its
+            # assigned video and only picks a random one if that attempt fails too.
+            # Retries filter on the CPU, since NVDEC or the CUDA filters may be what
+            # failed (e.g. a codec NVDEC can't decode)
+            retry_hwaccel = 'nvenc' if hwaccel == CUDA_PIPELINE else hwaccel
+            retry_indices = [i for i, segment_file in enumerate(results) if segment_file is None]
+            if retry_indices:
+                logger.warning(f"Retrying {len(retry_indices)} segments individually")
+            retry_results = executor.map(
+                lambda i: process_segment(segments[i], i, assignments[i], working_dir,
+                                          output_width, output_height, fallback_pool=video_files,
+                                          start_time=start_times[i], threads=threads_per_job,
+                                          video_info=video_info, hwaccel=retry_hwaccel),
+                retry_indices
+            )
+            for i, (success, segment_file) in zip(retry_indices, retry_results):
+                if success:
+                    results[i] = segment_file
+
+        # Results are stored in segment order
+        for i, segment_file in enumerate(results):
+            if segment_file:
                 segment_files.append(segment_file)
             else:
                 failed_segments.append(i)
@@ -473,35 +933,24 @@ def create_edited_video(segments_file, video_folder, output_file, output_width,
             if len(failed_segments) == len(segments):
                 raise ValueError("All segments failed to process")
 
-        # Create file list for concatenation
-        concat_file = os.path.join(working_dir, 'concat.txt')
-        with open(concat_file, 'w') as f:
-            for segment_file in segment_files:
-                if os.path.exists(segment_file):  # Only include successfully created segments
-                    f.write(f"file '{segment_file}'\n")
+        # Join the MPEG-TS segments with the concat protocol; only include successfully created segments
+        concat_input = 'concat:' + '|'.join(
+            segment_file for segment_file in segment_files if os.path.exists(segment_file)
+        )
 
-        # Create temporary video without audio, using re-encode instead of copy
+        # Create temporary video without audio; segments share encoder settings so stream copy is safe
         temp_video = os.path.join(working_dir, 'temp_final.mp4')
         concat_cmd = [
             'ffmpeg', '-y',
             '-v', 'warning',
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', concat_file,
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-video_track_timescale', '30000',
+            '-i', concat_input,
+            '-c', 'copy',
+            '-video_track_timescale', '30000',  # Consistent timescale
             '-movflags', '+faststart',
-            '-pix_fmt', 'yuv420p',
-            '-color_range', '1',
-            '-colorspace', 'bt709',
-            '-color_primaries', 'bt709',
-            '-color_trc', 'bt709',
             temp_video
         ]
 
-        run_ffmpeg_command(concat_cmd, concat_file, temp_video, 999999)
+        run_ffmpeg_command(concat_cmd, concat_input, temp_video, 999999)
 
         # Add custom audio track if provided
         if audio_file:
@@ -549,6 +998,9 @@ if __name__ == "__main__":
     parser.add_argument('--extensions', default='mp4,mov,mkv,avi',
                       help='Comma-separated list of video file extensions to include (default: mp4,mov,mkv,avi)')
     parser.add_argument('--temp-dir', help='Optional custom temporary directory path')
+    parser.add_argument('--hwaccel', choices=[key for key in HWACCEL_ENCODERS if key],
+                      help='Hardware H.264 encoder to use: nvenc, vaapi or vt (default: libx264 on the CPU)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible segment selection')
 
     args = parser.parse_args()
 
@@ -560,5 +1012,7 @@ if __name__ == "__main__":
         args.height,
         args.audio,
         args.extensions,
-        args.temp_dir
+        args.temp_dir,
+        args.hwaccel,
+        args.seed
     )
\ No newline at end of file